@@ -9,10 +9,12 @@ python2.7 pycyc.py input_cs_file.ar   # This will generate an initial profile fr
 
 python2.7 pycyc.py input_cs_file.ar some_profile.txt  # This will use the profile in some_profile.txt
 
+If pyfftw is installed the CyclicSolver methods run their FFTs through it, otherwise scipy's own FFTs are used.
+
 The majority of these routines have been checked against the original Cyclic-Modelling code
 and produce identical results to floating point accuracy. The results of the optimization may
 not be quite as identical since Cyclic-Modelling uses the nlopt implementation of the L_BFGS solver
-while this code uses scipy.optimize.fmin_l_bfgs_b
+while this code uses the L-BFGS-B method of scipy.optimize.minimize
 
 Here's an example of how I use this on kermit.
 
@@ -98,23 +100,117 @@ from matplotlib import pyplot as plt
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_agg import FigureCanvasAgg
 import pickle
-import scipy, scipy.optimize
-from scipy.fft import fftshift, fft, rfft, ifft, irfft
+import types
+import functools
+import contextlib
+import math
+import concurrent.futures
+import hashlib
+import scipy, scipy.optimize, scipy.fft
+from scipy.fft import fftshift, fft, rfft, ifft, irfft, ihfft
 import os
 
+try:
+    # Use FFTW through pyfftw's scipy.fft interface when it is available (see _fft_config). The interface
+    # cache keeps the FFTW plans (and their aligned buffers) alive between calls, so the fixed-shape
+    # transforms in the solver are planned once with FFTW_MEASURE rather than on every objective evaluation.
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft
+except ImportError:
+    pyfftw = None  # scipy's built-in pocketfft backend is used instead
+
+DEFAULT_CACHEDIR = os.path.join(os.path.expanduser("~"), ".cache", "pycyc")
+# Precision in which the data and the per-subint results are stored. The L-BFGS-B parameters, filter and
+# gradient are always double precision, since the optimizer works in float64. Set to np.complex128 for
+# validation runs (existing cache entries are keyed on this too).
+CS_DTYPE = np.complex64
+
+# bump whenever _read_archive's processing changes so stale cache entries are not reused
+_CACHE_VERSION = 3
+
+
+class _PyfftwBackend:
+    """
+    scipy.fft backend forwarding to pyfftw's interface, planning with FFTW_MEASURE
+
+    An unset workers is passed on as scipy.fft.get_workers(), since older pyfftw versions would otherwise
+    use pyfftw.config.NUM_THREADS and ignore scipy.fft.set_workers.
+    """
+
+    __ua_domain__ = "numpy.scipy.fft"
+
+    @staticmethod
+    def __ua_function__(method, args, kwargs):
+        kwargs = dict(kwargs)
+        if kwargs.get("workers") is None:
+            kwargs["workers"] = scipy.fft.get_workers()
+        if kwargs.get("planner_effort") is None:
+            kwargs["planner_effort"] = "FFTW_MEASURE"
+        return pyfftw.interfaces.scipy_fft.__ua_function__(method, args, kwargs)
+
+
+@contextlib.contextmanager
+def _fft_config(workers):
+    """
+    Run scipy.fft transforms with the given number of workers, through pyfftw if it is installed
+
+    Both settings are local to the calling thread and undone on exit, so other users of scipy.fft
+    (and other threads) keep their own configuration.
+    """
+    with scipy.fft.set_workers(workers):
+        if pyfftw is None:
+            yield
+            return
+        if not pyfftw.interfaces.cache.is_enabled():
+            pyfftw.interfaces.cache.enable()
+            pyfftw.interfaces.cache.set_keepalive_time(600)
+        with scipy.fft.set_backend(_PyfftwBackend):
+            yield
+
+
+def _fft_workers(method):
+    """
+    Run a CyclicSolver method with scipy.fft using self.workers threads for every transform (see _fft_config)
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with _fft_config(getattr(self, "workers", -1)):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
 
 class CyclicSolver:
-    def __init__(self, filename=None, statefile=None, offp=None, tscrunch=None, zap_edges=None, pscrunch=False, maxchan=None):
+    def __init__(
+        self,
+        filename=None,
+        statefile=None,
+        offp=None,
+        tscrunch=None,
+        zap_edges=None,
+        pscrunch=False,
+        maxchan=None,
+        workers=-1,
+        cachedir=None,
+    ):
         """
+        *filename* : archive to load, or a list of archives whose subintegrations are joined (optional)
         *offp* : passed to the load method for selecting an off pulse region (optional).
         *tscrunch* : passed to the load method for averaging subintegrations
         *offp*: tuple (start,end) with start and end bin numbers to use as off pulse region for normalizing the bandpass
         *maxchan*: Top channel index to use. Quick and dirty way to pull out one subband from a file which contains multiple
                     subbands
-        *tscrunch* : average down by a factor of 1/tscrunch (i.e. if tscrunch = 2, average every pair of subints)
+        *tscrunch* : average down by a factor of 1/tscrunch (i.e. if tscrunch = 2, average every pair of subints);
+                    an archive with fewer than tscrunch subints becomes a single averaged subint
         *pscrunch* : average the polarisations
+        *workers* : number of threads per FFT (scipy.fft or pyfftw) inside initProfile and loop (-1 uses all cores)
+        *cachedir* : directory in which to cache processed archives between runs, e.g. pycyc.DEFAULT_CACHEDIR
+                    (optional, caching is off by default)
         """
 
+        self.workers = workers
+        self.cachedir = cachedir
         self.zap_edges = zap_edges
         self.pscrunch = pscrunch
         self.tscrunch = tscrunch
@@ -146,10 +242,74 @@ class CyclicSolver:
 
     def load(self, filename):
         """
-        Load periodic spectrum from psrchive compatible file (.ar or .fits)
+        Load periodic spectrum from psrchive compatible file (.ar or .fits), or from a list of them
+
+        The subintegrations of all the files are joined with a single concatenation at the end, rather
+        than by copying the data accumulated so far for every file.
+
+        If the solver was given a cachedir, the processed data and header are cached there so that
+        loading the same file with the same options again skips psrchive entirely
         """
+        filenames = [filename] if isinstance(filename, str) else list(filename)
+
+        chunks = [self.data] if self.nspec else []
+        for filename in filenames:
+            self.filenames.append(filename)
+            data, header = self._read_archive(filename)
+
+            if self.nspec == 0:
+
+                self.nspec, self.npol, self.nchan, self.nbin = data.shape
+
+                self.imjd = header["imjd"]
+                self.fmjd = header["fmjd"]
+                self.ref_phase = 0.0
+                self.ref_freq = header["ref_freq"]
+                self.bw = header["bw"]
+                self.rf = header["rf"]
+
+                self.source = header["source"]  # source name
+
+                self.nlag = self.nchan
+                self.nphase = self.nbin
+                self.nharm = self.nphase // 2 + 1
+                self.nopt = 0
+                self.nloop = 0
+            else:
+                nspec, npol, nchan, nbin = data.shape
+
+                assert npol == self.npol
+                assert nchan == self.nchan
+                assert nbin == self.nbin
+
+                self.nspec += nspec
+            chunks.append(data)
+
+        self.data = chunks[0] if len(chunks) == 1 else np.concatenate(chunks, axis=0)
+
+        nspec, npol, nchan, nbin = self.data.shape
+
+        assert nspec == self.nspec
+        assert npol == self.npol
+        assert nchan == self.nchan
+        assert nbin == self.nbin
+
+        self.dynamic_spectrum = np.zeros((self.nspec, self.nchan))
+        self.optimized_filters = np.zeros((self.nspec, self.nchan), dtype=CS_DTYPE)
+        self.intrinsic_profiles = np.zeros((self.nspec, self.nbin))
+
+    def _read_archive(self, filename):
+        """
+        Read one archive with psrchive and apply the zap_edges/maxchan/offp/tscrunch options
+
+        Returns (data, header) where header holds the parameters of the first integration.
+        Goes through the on-disk cache when self.cachedir is set.
+        """
+        cachefile = self._cachefile(filename)
+        if cachefile is not None and os.path.exists(cachefile):
+            with open(cachefile, "rb") as fh:
+                return pickle.load(fh)
 
-        self.filenames.append( filename )
         ar = psrchive.Archive_load(filename)
         if self.pscrunch:
             ar.pscrunch()
@@ -160,7 +320,7 @@ class CyclicSolver:
             data = data[:, :, zap_count:-zap_count, :]
             bwfact = 1.0 - self.zap_edges * 2
         elif self.maxchan:
-            bwfact = self,maxchan / (
+            bwfact = self.maxchan / (
                 1.0 * data.shape[2]
             )  # bwfact used to indicate the actual bandwidth of the data if we're not using all channels.
             data = data[:, :, :self.maxchan, :]
@@ -171,65 +331,73 @@ class CyclicSolver:
             data = data / (np.abs(data[:, :, :, self.offp[0] : self.offp[1]]).mean(3)[:, :, :, None])
 
         if self.tscrunch:
-            for k in range(1, self.tscrunch):
-                data[:-k, :, :, :] += data[k:, :, :, :]
-        #            d = data
-        #            nsub = d.shape[0]/tscrunch
-        #            ntot = nsub*tscrunch
-        #            data = d[:ntot,:,:,:].reshape((nsub,tscrunch,d.shape[1],d.shape[2],d.shape[3])).mean(1)
-
-        if self.nspec == 0:
-
-            self.nspec, self.npol, self.nchan, self.nbin = data.shape
-            self.data = data
-
-            idx = 0  # only used to get parameters of integration, not data itself
-            subint = ar.get_Integration(idx)            
-            epoch = subint.get_epoch()
-            try:
-                self.imjd = np.floor(epoch)
-                self.fmjd = np.fmod(epoch, 1)
-            except:  # new version of psrchive has different kind of epoch
-                self.imjd = epoch.intday()
-                self.fmjd = epoch.fracday()
-            self.ref_phase = 0.0
-            self.ref_freq = 1.0 / subint.get_folding_period()
-            self.bw = np.abs(subint.get_bandwidth()) * bwfact
-            self.rf = subint.get_centre_frequency()
-
-            self.source = ar.get_source()  # source name
-
-            self.nlag = self.nchan
-            self.nphase = self.nbin
-            self.nharm = int(self.nphase / 2) + 1
-            self.nopt = 0
-            self.nloop = 0
-
-            ar = None;
-        else:
-            ar = None;
-
-            nspec, npol, nchan, nbin = data.shape
-
-            assert npol == self.npol
-            assert nchan == self.nchan
-            assert nbin == self.nbin
-
-            self.nspec += nspec
-            self.data = np.append(self.data, data, axis=0)
-
-            nspec, npol, nchan, nbin = self.data.shape
-
-            assert nspec == self.nspec
-            assert npol == self.npol
-            assert nchan == self.nchan
-            assert nbin == self.nbin
+            # average blocks of tscrunch subintegrations, dropping any incomplete block at the end; an archive
+            # with fewer than tscrunch subintegrations is averaged into a single one rather than emptied
+            block = min(self.tscrunch, data.shape[0])
+            nsub = data.shape[0] // block
+            ntot = nsub * block
+            data = data[:ntot].reshape((nsub, block) + data.shape[1:]).mean(1)
+
+        # stored at the precision of CS_DTYPE: single precision halves the memory and bandwidth of every
+        # ps2cs/padding pass (rfft of float32 data yields complex64 spectra)
+        data = np.ascontiguousarray(data, dtype=np.finfo(CS_DTYPE).dtype)
+
+        idx = 0  # only used to get parameters of integration, not data itself
+        subint = ar.get_Integration(idx)
+        epoch = subint.get_epoch()
+        header = {}
+        try:
+            header["imjd"] = np.floor(epoch)
+            header["fmjd"] = np.fmod(epoch, 1)
+        except:  # new version of psrchive has different kind of epoch
+            header["imjd"] = epoch.intday()
+            header["fmjd"] = epoch.fracday()
+        header["ref_freq"] = 1.0 / subint.get_folding_period()
+        header["bw"] = np.abs(subint.get_bandwidth()) * bwfact
+        header["rf"] = subint.get_centre_frequency()
+        header["source"] = ar.get_source()
+        ar = None
+
+        if cachefile is not None:
+            # write to a temporary file first so an interrupted run never leaves a truncated cache entry
+            tmpfile = "%s.%d.tmp" % (cachefile, os.getpid())
+            with open(tmpfile, "wb") as fh:
+                pickle.dump((data, header), fh, protocol=-1)
+            os.replace(tmpfile, cachefile)
+
+        return data, header
+
+    def _cachefile(self, filename):
+        """
+        Name of the cache entry for filename, or None if caching is disabled
 
-        self.dynamic_spectrum = np.zeros((self.nspec, self.nchan))
-        self.optimized_filters = np.zeros((self.nspec, self.nchan), dtype="complex")
-        self.intrinsic_profiles = np.zeros((self.nspec, self.nbin))
+        The key covers the file's path, size and modification time as well as every load option,
+        so editing the archive or changing an option results in a fresh read.
+        """
+        cachedir = getattr(self, "cachedir", None)
+        if not cachedir:
+            return None
+        stat = os.stat(filename)
+        key = repr(
+            (
+                _CACHE_VERSION,
+                np.dtype(CS_DTYPE).str,
+                os.path.abspath(filename),
+                stat.st_size,
+                stat.st_mtime_ns,
+                self.zap_edges,
+                self.pscrunch,
+                self.offp,
+                self.tscrunch,
+                self.maxchan,
+            )
+        )
+        os.makedirs(cachedir, exist_ok=True)
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(cachedir, "%s.%s.pkl" % (os.path.basename(filename), digest))
 
-    def initProfile(self, loadFile=None, ipol=0, maxinitharm=None):
+    @_fft_workers
+    def initProfile(self, loadFile=None, ipol=0, maxinitharm=None, nthreads=None):
         """
         Initialize the reference profile
 
@@ -241,6 +409,7 @@ class CyclicSolver:
         The results of this routine have been checked to agree with filter_profile -i
 
         *maxinitharm* : zero harmonics above this one in the initial profile (acts to smooth/denoise) (optional)
+        *nthreads* : number of subintegrations to process concurrently (default: one per core)
 
         """
         hf_prev = np.ones((self.nchan,), dtype="complex")
@@ -259,23 +428,27 @@ class CyclicSolver:
 
         # initialize profile from data
         # the results of this routine have been checked against filter_profile and they perform the same
-        for isub in range(self.data.shape[0]):
-            ps = self.data[isub, ipol]
-            cs = ps2cs(ps)
-            cs = normalize_cs(cs, bw=self.bw, ref_freq=self.ref_freq)
-            cs = cyclic_padding(cs, self.bw, self.ref_freq)
-            hf = np.ones((self.nchan,), dtype="complex")
-            ht = freq2time(hf)
-            rindex = np.abs(ht).argmax()
-            self.rindex = rindex
-
-            ph = optimize_profile(cs, hf, self.bw, self.ref_freq)
-            ph[0] = 0.0
-            if maxinitharm:
-                ph[maxinitharm:] = 0.0
-            pp = harm2phase(ph)
-
-            self.pp_int += pp
+        hf = np.ones((self.nchan,), dtype="complex")
+        ht = freq2time(hf)
+        self.rindex = np.abs(ht).argmax()
+
+        # The subintegrations are independent. They are converted to cyclic spectra a block at a time with
+        # one batched (multithreaded) rfft, normalisation and padding, which bounds the memory to one block
+        # of spectra, and each block's profile fits are then spread over a thread pool (the FFTs and numpy
+        # release the GIL). The pool already runs one fit per core, so each of its transforms is made single
+        # threaded (with pyfftw as well as scipy.fft) rather than oversubscribing the cores.
+        def init_one(cs):
+            with _fft_config(1):
+                return _init_profile_one(cs, hf, self.bw, self.ref_freq, maxinitharm)
+
+        nblock = nthreads or os.cpu_count()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=nblock) as pool:
+            for start in range(0, self.data.shape[0], nblock):
+                cs = ps2cs(self.data[start : start + nblock, ipol])
+                cs = normalize_cs(cs, bw=self.bw, ref_freq=self.ref_freq, out=cs)
+                cs = cyclic_padding(cs, self.bw, self.ref_freq)
+                for pp in pool.map(init_one, cs):  # in subint order
+                    self.pp_int += pp
 
         self.pp_ref = self.pp_int[:]
 
@@ -285,7 +458,7 @@ class CyclicSolver:
         """
         if kwargs.pop("restart", False):
             self.nopt = 0
-        savefile = kwargs.pop("savebase", os.path.abspath(self.filename) + ("_%02d.cysolve.pkl" % self.nloop))
+        savefile = kwargs.pop("savebase", os.path.abspath(self.filename) + ("_%02d.cysolve.npz" % self.nloop))
 
         if "savedir" in kwargs:
             savedir = kwargs["savedir"]
@@ -298,6 +471,7 @@ class CyclicSolver:
         self.pp_ref = self.pp_int
         self.nloop += 1
 
+    @_fft_workers
     def loop(
         self,
         isub=0,
@@ -318,6 +492,7 @@ class CyclicSolver:
         onp=None,
         adjust_delay=True,
         plot_every=1,
+        maxcor=20,
     ):
         """
         Run the non-linear solver to compute the IRF
@@ -329,10 +504,15 @@ class CyclicSolver:
             uses convergence criteria from original filter_profile.
             Try 10 for less stringent (faster) convergence
         iprint: int
-            Passed to scipy.optimize.fmin_l_bfgs (see docs)
+            Passed to the L-BFGS-B solver of scipy.optimize.minimize (see docs)
             use 0 for silent, 1 for verbose, 2 for more log info
+        maxcor: int
+            number of correction pairs L-BFGS-B keeps for its Hessian approximation
 
         max_plot_lag: highest lag to plot in diagnostic plots.
+        plot_every: int
+            with make_plots, plot every plot_every-th objective function evaluation. Each figure is rendered
+            in the background while the solver continues, but a new one waits until the previous one is done
         use_last_soln: If true, use last filter as initial guess for this subint
         use_minphase: if true, use minimum phase IRF as initial guess
                         else use delta function
@@ -357,7 +537,7 @@ class CyclicSolver:
         self.iprint = iprint
         ps = self.data[isub, ipol]  # dimensions will now be (nchan,nbin)
         cs = ps2cs(ps)
-        cs = normalize_cs(cs, bw=self.bw, ref_freq=self.ref_freq)
+        cs = normalize_cs(cs, bw=self.bw, ref_freq=self.ref_freq, out=cs)  # cs is a fresh array, so in place
         cs = cyclic_padding(cs, self.bw, self.ref_freq)
 
         if hf_prev is None:
@@ -370,9 +550,7 @@ class CyclicSolver:
 
         self.dynamic_spectrum[isub, :] = np.real(cs[:, 0])
 
-        self.ph_ref = phase2harm(self.pp_ref)
-        self.ph_ref = normalize_profile(self.ph_ref)
-        self.ph_ref[0] = 0
+        self.ph_ref = self._reference_harmonics()
         ph = self.ph_ref[:]
         self.s0 = ph
 
@@ -391,15 +569,17 @@ class CyclicSolver:
                         print("onp not specified, so not using minimum phase")
                     else:
                         spect = np.abs(self.data[isub, ipol, :, onp[0] : onp[1]]).mean(1)
-                        ht = freq2time(minphase(spect - spect.min()))
-                        ht = np.roll(ht, delay)
-                        print("using minimum phase with peak at:", np.abs(ht).argmax())
+                        if np.ptp(spect) <= np.finfo(spect.dtype).eps * spect.mean():
+                            # the minimum phase filter of a flat spectrum is just the delta function
+                            print("on pulse spectrum is flat, so not using minimum phase")
+                        else:
+                            ht = freq2time(minphase(spect - spect.min()))
+                            ht = np.roll(ht, delay)
+                            print("using minimum phase with peak at:", np.abs(ht).argmax())
             else:
-                ht = ht0.copy()
-            hf = time2freq(ht)
+                ht = np.array(ht0, dtype="complex")  # copy
         else:
-            hf = _hf_prev.copy()
-        ht = freq2time(hf)
+            ht = freq2time(_hf_prev)
 
         if self.nopt == 0 or adjust_delay:
             if rindex is None:
@@ -413,7 +593,7 @@ class CyclicSolver:
             if maxlen is not None:
                 valsamp = maxlen
             else:
-                valsamp = int(ht.shape[0] / 2) + maxneg
+                valsamp = ht.shape[0] // 2 + maxneg
             minbound = np.zeros_like(ht)
             minbound[:valsamp] = 1 + 1j
             minbound = np.roll(minbound, rindex - maxneg)
@@ -422,9 +602,9 @@ class CyclicSolver:
             bounds = [(bchoice[int(x)], bchoice[int(x)]) for x in b]
         else:
             bounds = None
-        # rotate phase time
+        # rotate phase time (ht is always a fresh array here, so this is done in place)
         phasor = np.conj(ht[rindex])
-        ht = ht * phasor / np.abs(phasor)
+        ht *= phasor / np.abs(phasor)
 
         dim0 = 2 * self.nlag - 1
 
@@ -445,17 +625,37 @@ class CyclicSolver:
         self.niter = 0
         self.objval = []
 
-        x, f, d = scipy.optimize.fmin_l_bfgs_b(
-            cyclic_merit_lag, x0, m=20, args=(self,), iprint=iprint, maxfun=maxfun, factr=scipytol, bounds=bounds
-        )
-        ht = get_ht(x, rindex)
+        # diagnostic plots are rendered by a separate process so they don't hold up the solver
+        self._plot_pool = concurrent.futures.ProcessPoolExecutor(max_workers=1) if self.make_plots else None
+        self._plot_jobs = []
+        try:
+            # ftol is the relative reduction criterion, i.e. fmin_l_bfgs_b's factr in units of machine epsilon
+            res = scipy.optimize.minimize(
+                cyclic_merit_lag,
+                x0,
+                args=(self,),
+                jac=True,
+                method="L-BFGS-B",
+                bounds=bounds,
+                options=dict(
+                    maxcor=maxcor, ftol=scipytol * np.finfo(float).eps, gtol=1e-5, maxfun=maxfun, iprint=iprint
+                ),
+            )
+        finally:
+            if self._plot_pool is not None:
+                self._plot_pool.shutdown(wait=True)
+            self._plot_pool = None
+        for job in self._plot_jobs:
+            job.result()  # re-raise any error from the plotting process
+        self._plot_jobs = []
+        ht = get_ht(res.x, rindex)
         hf = time2freq(ht)
 
         self.hf_soln = hf[:]
 
         hf = match_two_filters(_hf_prev, hf)
         self.optimized_filters[isub, :] = hf
-        self.hf_prev = hf.copy()
+        self.hf_prev = hf  # match_two_filters returns a new array, which is not modified below
 
         ph = optimize_profile(cs, hf, self.bw, self.ref_freq)
         ph[0] = 0.0
@@ -475,38 +675,48 @@ class CyclicSolver:
         writeArray(fbase + ".dynspec.txt", self.dynamic_spectrum)
         pass
 
-    def cyclic_variance(self, cs):
-        ih = self.nharm - 1
+    def _reference_harmonics(self):
+        """
+        Normalized harmonics of pp_ref (DC zeroed), recomputed only when the profile has changed
 
-        imin, imax = chan_limits_cs(iharm=ih, nchan=self.nchan, bw=self.bw, ref_freq=self.ref_freq)  # highest harmonic
-        var = (np.abs(cs[imin:imax, ih]) ** 2).sum()
-        nvalid = imax - imin
-        var = var / nvalid
+        pp_ref can alias pp_int, which loop() updates in place, so the cache is keyed on a copy of the
+        profile rather than on the identity of the array.
+        """
+        cached = getattr(self, "_ph_ref_cache", None)
+        if cached is not None and np.array_equal(cached[0], self.pp_ref):
+            return cached[1]
+        ph_ref = normalize_profile(phase2harm(self.pp_ref))
+        ph_ref[0] = 0
+        self._ph_ref_cache = (np.array(self.pp_ref), ph_ref)
+        return ph_ref
 
-        for ih in range(1, self.nharm - 1):
-            imin, imax = chan_limits_cs(iharm=ih, nchan=self.nchan, bw=self.bw, ref_freq=self.ref_freq)
-            nvalid += imax - imin
+    def cyclic_variance(self, cs):
+        """
+        Noise variance estimated from the highest harmonic, and the number of valid (real) samples
+        in harmonics 1..nharm-1
+        """
+        imin, imax = _chan_limits_table(self.nharm, self.nchan, self.bw, self.ref_freq)
+        ih = self.nharm - 1  # highest harmonic
+        sl = cs[imin[ih] : imax[ih], ih]
+        var = np.vdot(sl, sl).real / sl.size
+
+        nvalid = int((imax[1:] - imin[1:]).sum())
         return var, nvalid * 2
 
     def phase_gradient(self, cs, ph_ref=None):
         if ph_ref is None:
             ph_ref = self.ph_ref
         ih = 1
-        imin, imax = chan_limits_cs(iharm=ih, nchan=self.nchan, bw=self.bw, ref_freq=self.ref_freq)
-        grad_sum = cs[:, ih].sum()
-        grad_sum /= ph_ref[ih]
-        phase_angle = np.angle(grad_sum)
-        # ensure -pi < ph < pi
-        if phase_angle > np.pi:
-            phase_angle = phase_angle - 2 * np.pi
+        grad_sum = complex(cs[:, ih].sum() / ph_ref[ih])
+        phase_angle = math.atan2(grad_sum.imag, grad_sum.real)  # already within -pi..pi
         # express as delay
         phase_angle /= -2 * np.pi * self.ref_freq
         phase_angle *= 1e6 * self.bw
 
         if phase_angle > self.nchan / 2:
-            delay = int(self.nchan / 2)
+            delay = self.nchan // 2
         elif phase_angle < -(self.nchan / 2):
-            delay = int(self.nchan / 2 + 1)
+            delay = self.nchan // 2 + 1
         elif phase_angle < -0.1:
             delay = int(phase_angle) + self.nchan - 1
         else:
@@ -516,219 +726,308 @@ class CyclicSolver:
 
     def saveState(self, filename=None):
         """
-        not yet ready for use
         Save current state of this class (inlcuding current CS solution)
+
+        Array, scalar and string attributes are written to a compressed .npz archive (see loadState);
+        private caches (names starting with _) and attributes that numpy can't store natively are skipped.
         """
-        # For now we just use pickle for convenience. In the future, could use np.savez or HDF5 (or FITS)
         if filename is None:
             if self.statefile:
                 filename = self.statefile
             else:
-                filename = self.filename + ".cysolve.pkl"
-        orig_statefile = self.statefile
-
-        fh = open(filename, "w")
-        pickle.dump(self, fh, protocol=-1)
-        fh.close()
+                filename = self.filename + ".cysolve.npz"
+
+        state = {}
+        lists = []
+        tuples = []  # e.g. offp; stored as arrays, so their type is recorded to restore them
+        for name, value in vars(self).items():
+            if name.startswith("_") or value is None:
+                continue
+            arr = np.asarray(value)
+            if arr.dtype.hasobject:
+                continue
+            if isinstance(value, list):
+                lists.append(name)
+            elif isinstance(value, tuple):
+                tuples.append(name)
+            state[name] = arr
+        state["__lists__"] = np.array(lists, dtype=str)
+        state["__tuples__"] = np.array(tuples, dtype=str)
+
+        # pass an open file so numpy doesn't append .npz to the name
+        with open(filename, "wb") as fh:
+            np.savez_compressed(fh, **state)
 
-        self.statefile = orig_statefile
         print("Saved state in:", filename)
 
+    def loadState(self, filename):
+        """
+        Restore the attributes written by saveState
+        """
+        with np.load(filename, allow_pickle=False) as state:
+            lists = set(state["__lists__"].tolist())
+            tuples = set(state["__tuples__"].tolist()) if "__tuples__" in state.files else set()
+            for name in state.files:
+                if name in ("__lists__", "__tuples__"):
+                    continue
+                value = state[name]
+                if name in lists:
+                    value = value.tolist()
+                elif name in tuples:
+                    value = tuple(value.tolist())
+                elif value.ndim == 0:
+                    value = value.item()
+                setattr(self, name, value)
+
     def plotCurrentSolution(self):
-        cs_model = self.model
-        grad = self.grad
-        hf = self.hf
-        ht = self.ht
-        mlag = self.mlag
-        fig = Figure()
-        ax1 = fig.add_subplot(3, 3, 1)
-        csextent = [1, mlag - 1, self.rf + self.bw / 2.0, self.rf - self.bw / 2.0]
-        im = ax1.imshow(np.log10(np.abs(self.cs[:, 1:mlag])), aspect="auto", interpolation="nearest", extent=csextent)
-        # im = ax1.imshow(cs2ps(self.cs),aspect='auto',interpolation='nearest',extent=csextent)
-        ax1.set_xlim(0, mlag)
-        ax1.text(
-            0.9,
-            0.9,
-            "log|CS|",
-            fontdict=dict(size="small"),
-            va="top",
-            ha="right",
-            transform=ax1.transAxes,
-            bbox=dict(alpha=0.75, fc="white"),
-        )
-        im.set_clim(-4, 2)
-
-        ax1b = fig.add_subplot(3, 3, 2)
-        im = ax1b.imshow(
-            np.angle(self.cs[:, :mlag]) - np.median(np.angle(self.cs[:, :mlag]), axis=0)[None, :],
-            cmap="hsv",
-            aspect="auto",
-            interpolation="nearest",
-            extent=csextent,
-        )
-        # im = ax1b.imshow(self.cs[:,:mlag].imag,aspect='auto',interpolation='nearest',extent=csextent)
-
-        im.set_clim(-np.pi, np.pi)
-        ax1b.set_xlim(0, mlag)
-        ax1b.text(
-            0.9,
-            0.9,
-            "angle(CS)",
-            fontdict=dict(size="small"),
-            va="top",
-            ha="right",
-            transform=ax1b.transAxes,
-            bbox=dict(alpha=0.75, fc="white"),
-        )
-        for tl in ax1b.yaxis.get_ticklabels():
-            tl.set_visible(False)
-        ax2 = fig.add_subplot(3, 3, 4)
-        im = ax2.imshow(np.log10(np.abs(cs_model[:, 1:mlag])), aspect="auto", interpolation="nearest", extent=csextent)
-        # im = ax2.imshow(cs2ps(cs_model),aspect='auto',interpolation='nearest',extent=csextent)
-        im.set_clim(-4, 2)
-        ax2.set_xlim(0, mlag)
-        ax2.set_ylabel("RF (MHz)")
-        ax2.text(
-            0.9,
-            0.9,
-            "log|CS model|",
-            fontdict=dict(size="small"),
-            va="top",
-            ha="right",
-            transform=ax2.transAxes,
-            bbox=dict(alpha=0.75, fc="white"),
-        )
+        """
+        Plot the current state of the solver to plotdir
 
-        ax2b = fig.add_subplot(3, 3, 5)
-        im = ax2b.imshow(
-            np.angle(cs_model[:, :mlag]) - np.median(np.angle(cs_model[:, :mlag]), axis=0)[None, :],
-            cmap="hsv",
-            aspect="auto",
-            interpolation="nearest",
-            extent=csextent,
-        )
-        # im = ax2b.imshow(cs_model[:,:mlag].imag,aspect='auto',interpolation='nearest',extent=csextent)
-        im.set_clim(-np.pi, np.pi)
-        ax2b.set_xlim(0, mlag)
-        ax2b.text(
-            0.9,
-            0.9,
-            "angle(CS model)",
-            fontdict=dict(size="small"),
-            va="top",
-            ha="right",
-            transform=ax2b.transAxes,
-            bbox=dict(alpha=0.75, fc="white"),
-        )
-        for tl in ax2b.yaxis.get_ticklabels():
-            tl.set_visible(False)
-        sopt = optimize_profile(self.cs, hf, self.bw, self.ref_freq)
-        sopt = normalize_profile(sopt)
-        sopt[0] = 0.0
-        smeas = normalize_profile(self.cs.mean(0))
-        smeas[0] = 0.0
-        #        cs_model0,csplus,csminus,phases = make_model_cs(hf,sopt,self.bw,self.ref_freq)
-
-        ax3 = fig.add_subplot(3, 3, 7)
-        #        ax3.imshow(np.log(np.abs(cs_model0)[:,1:]),aspect='auto')
-        err = np.abs(self.cs - cs_model)[:, 1:mlag]
-        # err = cs2ps(self.cs) - cs2ps(normalize_cs(cs_model,self.bw,self.ref_freq))
-        im = ax3.imshow(err, aspect="auto", interpolation="nearest", extent=csextent)
-        ax3.set_xlim(0, mlag)
-        #        im.set_clim(err[1:-1,1:-1].min(),err[1:-1,1:-1].max())
-        im.set_clim(0, 3 * self.noise)
-        ax3.text(
-            0.9,
-            0.9,
-            "|error|",
-            fontdict=dict(size="small"),
-            va="top",
-            ha="right",
-            transform=ax3.transAxes,
-            bbox=dict(alpha=0.75, fc="white"),
-        )
-        ax3.set_xlabel("Harmonic")
-
-        ax3b = fig.add_subplot(3, 3, 8)
-        im = ax3b.imshow(
-            np.angle((self.cs[:, :mlag] / cs_model[:, :mlag])),
-            cmap="hsv",
-            aspect="auto",
-            interpolation="nearest",
-            extent=csextent,
-        )
-        # im = ax3b.imshow((self.cs[:,:mlag]-cs_model[:,:mlag]).imag,aspect='auto',interpolation='nearest',extent=csextent)
-        im.set_clim(-np.pi / 2.0, np.pi / 2.0)
-        ax3b.set_xlim(0, mlag)
-        ax3b.text(
-            0.9,
-            0.9,
-            "angle(error)",
-            fontdict=dict(size="small"),
-            va="top",
-            ha="right",
-            transform=ax3b.transAxes,
-            bbox=dict(alpha=0.75, fc="white"),
-        )
-        for tl in ax3b.yaxis.get_ticklabels():
-            tl.set_visible(False)
-        ax3b.set_xlabel("Harmonic")
-
-        ax4 = fig.add_subplot(4, 3, 3)
-        t = np.arange(ht.shape[0]) / self.bw
-        ax4.plot(t, np.roll(20 * np.log10(np.abs(ht)), int(ht.shape[0] / 2) - self.rindex))
-        ax4.plot(
-            t,
-            np.roll(
-                20 * np.log10(np.convolve(np.ones((10,)) / 10.0, np.abs(ht), mode="same")),
-                int(ht.shape[0] / 2) - self.rindex,
-            ),
-            linewidth=2,
-            color="r",
-            alpha=0.4,
-        )
+        While loop() is running the figure is rendered in a background process, so the solver carries on
+        as soon as the arrays have been copied; otherwise it is rendered before returning.
+        At most one render is in flight: if the previous figure is still being rendered, this waits for it
+        to finish before submitting the next, so every requested frame is written and memory stays bounded.
+        """
+        pool = getattr(self, "_plot_pool", None)
+        if pool is not None and self._plot_jobs:
+            self._plot_jobs[-1].result()  # also re-raises any error from the plotting process
+        # only what the figure needs is copied, so the snapshot is cheap to send to the plotting process
+        names = ("cs", "s0", "mlag", "rf", "bw", "nchan", "noise", "rindex", "filename", "source", "isub", "ipol")
+        names += ("nopt", "niter", "plotdir", "ref_freq")
+        snapshot = types.SimpleNamespace(**{name: getattr(self, name) for name in names})
+        snapshot.model = np.array(self.model)
+        snapshot.grad = np.array(self.grad)
+        snapshot.hf = np.array(self.hf)
+        snapshot.ht = np.array(self.ht)
+        snapshot.objval = list(self.objval)
+        if pool is None:
+            _plot_solution(snapshot)
+        else:
+            self._plot_jobs.append(pool.submit(_plot_solution, snapshot))
 
-        ax4.set_ylim(0, 80)
-        ax4.set_xlim(t[0], t[-1])
-        ax4.text(0.9, 0.9, "dB|h(t)|$^2$", fontdict=dict(size="small"), va="top", ha="right", transform=ax4.transAxes)
-        ax4.text(0.95, 0.01, "$\\mu$s", fontdict=dict(size="small"), va="bottom", ha="right", transform=ax4.transAxes)
-        ax4b = fig.add_subplot(4, 3, 6)
-        f = np.linspace(self.rf + self.bw / 2.0, self.rf - self.bw / 2.0, self.nchan)
-        ax4b.plot(f, np.abs(hf))
-        ax4b.text(0.9, 0.9, "|H(f)|", fontdict=dict(size="small"), va="top", ha="right", transform=ax4b.transAxes)
-        ax4b.text(0.95, 0.01, "MHz", fontdict=dict(size="small"), va="bottom", ha="right", transform=ax4b.transAxes)
-        ax4b.set_xlim(f.min(), f.max())
-        ax4b.xaxis.set_major_locator(plt.MaxNLocator(4))
-        ax5 = fig.add_subplot(4, 3, 9)
-        if len(self.objval) >= 3:
-            x = np.abs(np.diff(np.array(self.objval).flatten()))
-            ax5.plot(np.arange(x.shape[0]), np.log10(x))
-        ax5.text(
-            0.9, 0.9, "log($\\Delta$merit)", fontdict=dict(size="small"), va="top", ha="right", transform=ax5.transAxes
-        )
-        ax6 = fig.add_subplot(4, 3, 12)
-        pref = harm2phase(self.s0)
-        ax6.plot(pref, label="Reference", linewidth=2)
-        ax6.plot(harm2phase(sopt), "r", label="Intrinsic")
-        ax6.plot(harm2phase(smeas), "g", label="Measured")
-        l = ax6.legend(loc="upper left", prop=dict(size="xx-small"), title="Profiles")
-        l.get_frame().set_alpha(0.5)
-        ax6.set_xlim(0, pref.shape[0])
-        fname = self.filename[-50:]
-        if len(self.filename) > 50:
-            fname = "..." + fname
-        title = "%s isub: %d ipol: %d nopt: %d\n" % (fname, self.isub, self.ipol, self.nopt)
-        title += "Source: %s Freq: %s MHz Feval #%04d Merit: %.3e Grad: %.3e" % (
-            self.source,
-            self.rf,
-            self.niter,
-            self.objval[-1],
-            np.abs(grad).sum(),
-        )
-        fig.suptitle(title, size="small")
-        canvas = FigureCanvasAgg(fig)
-        fname = os.path.join(self.plotdir, ("%s_%04d_%04d.png" % (self.source, self.nopt, self.niter)))
-        canvas.print_figure(fname)
+
+def _plot_solution(CS):
+    """
+    Render the figure for CyclicSolver.plotCurrentSolution from a snapshot of the solver's attributes
+    """
+    cs_model = CS.model
+    grad = CS.grad
+    hf = CS.hf
+    ht = CS.ht
+    mlag = CS.mlag
+    fig = Figure()
+    ax1 = fig.add_subplot(3, 3, 1)
+    csextent = [1, mlag - 1, CS.rf + CS.bw / 2.0, CS.rf - CS.bw / 2.0]
+    # the images are only displayed, so they are handed to matplotlib as float32
+    im = ax1.imshow(
+        np.log10(np.abs(CS.cs[:, 1:mlag])).astype(np.float32), aspect="auto", interpolation="nearest", extent=csextent
+    )
+    # im = ax1.imshow(cs2ps(CS.cs),aspect='auto',interpolation='nearest',extent=csextent)
+    ax1.set_xlim(0, mlag)
+    ax1.text(
+        0.9,
+        0.9,
+        "log|CS|",
+        fontdict=dict(size="small"),
+        va="top",
+        ha="right",
+        transform=ax1.transAxes,
+        bbox=dict(alpha=0.75, fc="white"),
+    )
+    im.set_clim(-4, 2)
+
+    ax1b = fig.add_subplot(3, 3, 2)
+    ang = np.angle(CS.cs[:, :mlag]).astype(np.float32)
+    ang -= np.median(ang, axis=0)[None, :]
+    im = ax1b.imshow(
+        ang,
+        cmap="hsv",
+        aspect="auto",
+        interpolation="nearest",
+        extent=csextent,
+    )
+    # im = ax1b.imshow(CS.cs[:,:mlag].imag,aspect='auto',interpolation='nearest',extent=csextent)
+
+    im.set_clim(-np.pi, np.pi)
+    ax1b.set_xlim(0, mlag)
+    ax1b.text(
+        0.9,
+        0.9,
+        "angle(CS)",
+        fontdict=dict(size="small"),
+        va="top",
+        ha="right",
+        transform=ax1b.transAxes,
+        bbox=dict(alpha=0.75, fc="white"),
+    )
+    for tl in ax1b.yaxis.get_ticklabels():
+        tl.set_visible(False)
+    ax2 = fig.add_subplot(3, 3, 4)
+    im = ax2.imshow(
+        np.log10(np.abs(cs_model[:, 1:mlag])).astype(np.float32),
+        aspect="auto",
+        interpolation="nearest",
+        extent=csextent,
+    )
+    # im = ax2.imshow(cs2ps(cs_model),aspect='auto',interpolation='nearest',extent=csextent)
+    im.set_clim(-4, 2)
+    ax2.set_xlim(0, mlag)
+    ax2.set_ylabel("RF (MHz)")
+    ax2.text(
+        0.9,
+        0.9,
+        "log|CS model|",
+        fontdict=dict(size="small"),
+        va="top",
+        ha="right",
+        transform=ax2.transAxes,
+        bbox=dict(alpha=0.75, fc="white"),
+    )
+
+    ax2b = fig.add_subplot(3, 3, 5)
+    ang = np.angle(cs_model[:, :mlag]).astype(np.float32)
+    ang -= np.median(ang, axis=0)[None, :]
+    im = ax2b.imshow(
+        ang,
+        cmap="hsv",
+        aspect="auto",
+        interpolation="nearest",
+        extent=csextent,
+    )
+    # im = ax2b.imshow(cs_model[:,:mlag].imag,aspect='auto',interpolation='nearest',extent=csextent)
+    im.set_clim(-np.pi, np.pi)
+    ax2b.set_xlim(0, mlag)
+    ax2b.text(
+        0.9,
+        0.9,
+        "angle(CS model)",
+        fontdict=dict(size="small"),
+        va="top",
+        ha="right",
+        transform=ax2b.transAxes,
+        bbox=dict(alpha=0.75, fc="white"),
+    )
+    for tl in ax2b.yaxis.get_ticklabels():
+        tl.set_visible(False)
+    sopt = optimize_profile(CS.cs, hf, CS.bw, CS.ref_freq)
+    sopt = normalize_profile(sopt)
+    sopt[0] = 0.0
+    smeas = normalize_profile(CS.cs.mean(0))
+    smeas[0] = 0.0
+    #        cs_model0,csplus,csminus,phases = make_model_cs(hf,sopt,CS.bw,CS.ref_freq)
+
+    ax3 = fig.add_subplot(3, 3, 7)
+    #        ax3.imshow(np.log(np.abs(cs_model0)[:,1:]),aspect='auto')
+    err = np.abs(CS.cs[:, 1:mlag] - cs_model[:, 1:mlag]).astype(np.float32)
+    # err = cs2ps(CS.cs) - cs2ps(normalize_cs(cs_model,CS.bw,CS.ref_freq))
+    im = ax3.imshow(err, aspect="auto", interpolation="nearest", extent=csextent)
+    ax3.set_xlim(0, mlag)
+    #        im.set_clim(err[1:-1,1:-1].min(),err[1:-1,1:-1].max())
+    im.set_clim(0, 3 * CS.noise)
+    ax3.text(
+        0.9,
+        0.9,
+        "|error|",
+        fontdict=dict(size="small"),
+        va="top",
+        ha="right",
+        transform=ax3.transAxes,
+        bbox=dict(alpha=0.75, fc="white"),
+    )
+    ax3.set_xlabel("Harmonic")
+
+    ax3b = fig.add_subplot(3, 3, 8)
+    im = ax3b.imshow(
+        np.angle((CS.cs[:, :mlag] / cs_model[:, :mlag])).astype(np.float32),
+        cmap="hsv",
+        aspect="auto",
+        interpolation="nearest",
+        extent=csextent,
+    )
+    # im = ax3b.imshow((CS.cs[:,:mlag]-cs_model[:,:mlag]).imag,aspect='auto',interpolation='nearest',extent=csextent)
+    im.set_clim(-np.pi / 2.0, np.pi / 2.0)
+    ax3b.set_xlim(0, mlag)
+    ax3b.text(
+        0.9,
+        0.9,
+        "angle(error)",
+        fontdict=dict(size="small"),
+        va="top",
+        ha="right",
+        transform=ax3b.transAxes,
+        bbox=dict(alpha=0.75, fc="white"),
+    )
+    for tl in ax3b.yaxis.get_ticklabels():
+        tl.set_visible(False)
+    ax3b.set_xlabel("Harmonic")
+
+    ax4 = fig.add_subplot(4, 3, 3)
+    t = np.arange(ht.shape[0]) / CS.bw
+    ax4.plot(t, np.roll(20 * np.log10(np.abs(ht)), ht.shape[0] // 2 - CS.rindex))
+    ax4.plot(
+        t,
+        np.roll(
+            20 * np.log10(np.convolve(np.ones((10,)) / 10.0, np.abs(ht), mode="same")),
+            ht.shape[0] // 2 - CS.rindex,
+        ),
+        linewidth=2,
+        color="r",
+        alpha=0.4,
+    )
+
+    ax4.set_ylim(0, 80)
+    ax4.set_xlim(t[0], t[-1])
+    ax4.text(0.9, 0.9, "dB|h(t)|$^2$", fontdict=dict(size="small"), va="top", ha="right", transform=ax4.transAxes)
+    ax4.text(0.95, 0.01, "$\\mu$s", fontdict=dict(size="small"), va="bottom", ha="right", transform=ax4.transAxes)
+    ax4b = fig.add_subplot(4, 3, 6)
+    f = np.linspace(CS.rf + CS.bw / 2.0, CS.rf - CS.bw / 2.0, CS.nchan)
+    ax4b.plot(f, np.abs(hf))
+    ax4b.text(0.9, 0.9, "|H(f)|", fontdict=dict(size="small"), va="top", ha="right", transform=ax4b.transAxes)
+    ax4b.text(0.95, 0.01, "MHz", fontdict=dict(size="small"), va="bottom", ha="right", transform=ax4b.transAxes)
+    ax4b.set_xlim(f.min(), f.max())
+    ax4b.xaxis.set_major_locator(plt.MaxNLocator(4))
+    ax5 = fig.add_subplot(4, 3, 9)
+    if len(CS.objval) >= 3:
+        x = np.abs(np.diff(np.array(CS.objval).flatten()))
+        ax5.plot(np.arange(x.shape[0]), np.log10(x))
+    ax5.text(
+        0.9, 0.9, "log($\\Delta$merit)", fontdict=dict(size="small"), va="top", ha="right", transform=ax5.transAxes
+    )
+    ax6 = fig.add_subplot(4, 3, 12)
+    pref = harm2phase(CS.s0)
+    ax6.plot(pref, label="Reference", linewidth=2)
+    ax6.plot(harm2phase(sopt), "r", label="Intrinsic")
+    ax6.plot(harm2phase(smeas), "g", label="Measured")
+    l = ax6.legend(loc="upper left", prop=dict(size="xx-small"), title="Profiles")
+    l.get_frame().set_alpha(0.5)
+    ax6.set_xlim(0, pref.shape[0])
+    fname = CS.filename[-50:]
+    if len(CS.filename) > 50:
+        fname = "..." + fname
+    title = "%s isub: %d ipol: %d nopt: %d\n" % (fname, CS.isub, CS.ipol, CS.nopt)
+    title += "Source: %s Freq: %s MHz Feval #%04d Merit: %.3e Grad: %.3e" % (
+        CS.source,
+        CS.rf,
+        CS.niter,
+        CS.objval[-1],
+        np.abs(grad).sum(),
+    )
+    fig.suptitle(title, size="small")
+    canvas = FigureCanvasAgg(fig)
+    fname = os.path.join(CS.plotdir, ("%s_%04d_%04d.png" % (CS.source, CS.nopt, CS.niter)))
+    canvas.print_figure(fname)
+
+
+def _init_profile_one(cs, hf, bw, ref_freq, maxinitharm=None):
+    """
+    Profile of one subintegration's normalized, padded cyclic spectrum cs, deconvolved with the filter hf
+    (used by initProfile)
+    """
+    ph = optimize_profile(cs, hf, bw, ref_freq)
+    ph[0] = 0.0
+    if maxinitharm:
+        ph[maxinitharm:] = 0.0
+    return harm2phase(ph)
 
 
 def plotSimulation(CS, mlag=100):
@@ -829,14 +1128,20 @@ def plotSimulation(CS, mlag=100):
         bbox=dict(alpha=0.75, fc="white"),
     )
 
+    # |h(t)| normalized to its peak and centred, shared by the dB and linear impulse response panels
+    aht0 = fftshift(np.abs(ht0))
+    aht0 /= aht0.max()
+    aht = fftshift(np.abs(ht))
+    aht /= aht.max()
+
     ax5 = fig.add_subplot(3, 3, 5)
     #    im = ax5.imshow(np.abs(CS.cs[:,:mlag]/cs0[:,:mlag]),
     #                     aspect='auto',interpolation='nearest',extent=csextent)
     #    im.set_clim(0.5,2)
-    ax5.plot(t / 1e3, fftshift(20 * np.log10(np.abs(ht0) / np.abs(ht0).max())), label="dB($|h(t)|^2$)")
+    ax5.plot(t / 1e3, 20 * np.log10(aht0), label="dB($|h(t)|^2$)")
     ax5.plot(
         t / 1e3,
-        fftshift(20 * np.log10(np.abs(ht) / np.abs(ht).max())) - 40.0,
+        20 * np.log10(aht) - 40.0,
         "r",
         label=r"dB($|\hat{h}(t)|^2$)-40",
     )
@@ -856,16 +1161,16 @@ def plotSimulation(CS, mlag=100):
     )
 
     ax8 = fig.add_subplot(3, 3, 8)
-    maxt0 = t[fftshift(np.abs(ht0)).argmax()]
-    maxt = t[fftshift(np.abs(ht)).argmax()]
+    maxt0 = t[aht0.argmax()]
+    maxt = t[aht.argmax()]
     if maxt0 < maxt:
         maxt = maxt0
     #    ax8.plot(t-maxt,np.fft.fftshift(20*np.log10(np.abs(ht0)/np.abs(ht0).max())),label='dB($|h(t)|^2$)')
     #    ax8.plot(t-maxt,np.fft.fftshift(20*np.log10(np.abs(ht)/np.abs(ht).max())),'r',label=r'dB($|\hat{h}(t)|^2$)')
     #    ax8.set_ylim(-80.,0)
 
-    ax8.plot(t - maxt, fftshift((np.abs(ht0) / np.abs(ht0).max())), label="$|h(t)|$")
-    ax8.plot(t - maxt, fftshift((np.abs(ht) / np.abs(ht).max())), "r", label=r"$|\hat{h}(t)|$")
+    ax8.plot(t - maxt, aht0, label="$|h(t)|$")
+    ax8.plot(t - maxt, aht, "r", label=r"$|\hat{h}(t)|$")
 
     left = -5 * CS.tau
     right = 20 * CS.tau
@@ -955,20 +1260,25 @@ def fold(v):
     Fold negative response onto positive time for minimum phase calculation
     """
     n = v.shape[0]
-    nt = int(n / 2)
-    rf = np.zeros_like(v[:nt])
-    rf[:-1] = v[1:nt]
-    rf += np.conj(v[: nt - 1 : -1])
+    nt = n // 2
     rw = np.zeros_like(v)
-    rw[0] = v[0]
-    rw[1 : nt + 1] = rf
+    rw[:nt] = v[:nt]
+    rw[1 : nt + 1] += np.conj(v[: nt - 1 : -1])
     return rw
 
 
-def minphase(v, workers=2):
-    clipped = v.copy()
+def minphase(v, workers=None):
     thresh = 1e-5
-    clipped[np.abs(v) < thresh] = thresh
+    clipped = np.where(np.abs(v) < thresh, thresh, v)
+    if np.isrealobj(clipped):
+        # the cepstrum of a real log spectrum is Hermitian, so only its non-negative lags are computed (ihfft)
+        # and folded directly: the negative lags just double the positive ones
+        n = clipped.shape[0]
+        half = ihfft(np.log(clipped), workers=workers)
+        rw = np.zeros((n,), dtype=half.dtype)
+        rw[: half.shape[0]] = half
+        rw[1 : (n + 1) // 2] *= 2
+        return np.exp(fft(rw, workers=workers))
     return np.exp(fft(fold(ifft(np.log(clipped), workers=workers)), workers=workers))
 
 
@@ -977,41 +1287,38 @@ def loadArray(fname):
     Load array from txt file in format generated by filter_profile,
     useful for filters.txt, dynamic_spectrum.txt
     """
-    fh = open(fname, "r")
-    try:
-        x = int(fh.readline())
-    except:
-        raise Exception("couldn't read first dimension")
-    try:
-        y = int(fh.readline())
-    except:
-        raise Exception("couldn't read second dimension")
-    raw = np.loadtxt(fh)
+    with open(fname, "r") as fh:
+        try:
+            x = int(fh.readline())
+        except:
+            raise Exception("couldn't read first dimension")
+        try:
+            y = int(fh.readline())
+        except:
+            raise Exception("couldn't read second dimension")
+        raw = np.loadtxt(fh, dtype=np.float64, ndmin=2)
     if raw.shape[0] != x * y:
         raise Exception("number of rows of data=", raw.shape[0], " not equal to product of dimensions:", x, y)
-    if len(raw.shape) > 1:
-        data = raw[:, 0] + raw[:, 1] * 1j
+    if raw.shape[1] > 1:
+        # each (real, imag) row is already laid out like a complex128, so reinterpret rather than copy
+        data = np.ascontiguousarray(raw[:, :2]).view(np.complex128)
     else:
-        data = raw[:]
-    data.shape = (x, y)
-    fh.close()
-    return data
+        data = raw
+    return data.reshape((x, y))
 
 
 def writeArray(fname, arr):
     """
     Write array to ascii file in same format as filter_profile does
     """
-    fh = open(fname, "w")
-    fh.write("%d\n" % arr.shape[0])
-    fh.write("%d\n" % arr.shape[1])
-    for x in range(arr.shape[0]):
-        for y in range(arr.shape[1]):
-            if arr.dtype == np.complex128:
-                fh.write("%.7e %.7e\n" % (arr[x, y].real, arr[x, y].imag))
-            else:
-                fh.write("%.7e\n" % (arr[x, y]))
-    fh.close()
+    flat = arr.reshape(-1)
+    with open(fname, "w") as fh:
+        fh.write("%d\n" % arr.shape[0])
+        fh.write("%d\n" % arr.shape[1])
+        if np.iscomplexobj(arr):
+            np.savetxt(fh, np.column_stack((flat.real, flat.imag)), fmt="%.7e %.7e")
+        else:
+            np.savetxt(fh, flat, fmt="%.7e")
 
 
 def writeProfile(fname, prof):
@@ -1019,10 +1326,7 @@ def writeProfile(fname, prof):
     Write profile to ascii file in same format as filter_profile does
     """
     t = np.linspace(0, 1, prof.shape[0], endpoint=False)
-    fh = open(fname, "w")
-    for x in range(prof.shape[0]):
-        fh.write("%.7e %.7e\n" % (t[x], prof[x]))
-    fh.close()
+    np.savetxt(fname, np.column_stack((t, prof)), fmt="%.7e %.7e")
 
 
 def loadProfile(fname):
@@ -1043,54 +1347,69 @@ def loadProfile(fname):
 # input array.
 # I've left the bug in for now to compare directly to filter_profile
 
+# workers=None defers to scipy.fft's default, which CyclicSolver sets (and routes through pyfftw
+# when it is installed) for the duration of initProfile and loop (see _fft_config)
 
-def cs2cc(cs, workers=2):
-    return cs.shape[0] * ifft(cs, axis=0, workers=workers)
 
+def cs2cc(cs, workers=None, axis=0, overwrite_x=False):
+    cc = ifft(cs, axis=axis, workers=workers, overwrite_x=overwrite_x)
+    cc *= cs.shape[axis]
+    return cc
 
-def cc2cs(cc, workers=2):
-    cs = fft(cc, axis=0, workers=workers)
+
+def cc2cs(cc, workers=None, axis=0):
+    cs = fft(cc, axis=axis, workers=workers)
     # cc2cs_renorm
-    return cs / cs.shape[0]
+    cs /= cs.shape[axis]
+    return cs
 
 
-def ps2cs(ps, workers=2):
-    cs = rfft(ps, axis=1, workers=workers)
-    # ps2cs renorm
-    return cs / cs.shape[1]  # original version from Cyclic-modelling
+def ps2cs(ps, workers=None):
+    cs = rfft(ps, axis=-1, workers=workers)  # along phase, also for a stack of subintegrations
+    # ps2cs renorm (in place: the transform output is a fresh array)
+    cs /= cs.shape[-1]  # original version from Cyclic-modelling
+    return cs
     # return cs/(2*(cs.shape[1] - 1))
 
 
-def cs2ps(cs, workers=2):
-    return (cs.shape[1] - 1) * 2 * irfft(cs, axis=1, workers=workers)
+def cs2ps(cs, workers=None):
+    ps = irfft(cs, axis=1, workers=workers)
+    ps *= (cs.shape[1] - 1) * 2
+    return ps
 
 
-def time2freq(ht, workers=2):
+def time2freq(ht, workers=None):
     hf = fft(ht, workers=workers)
     # filter_freq_renorm
-    return hf / hf.shape[0]
+    hf /= hf.shape[0]
+    return hf
 
 
-def freq2time(hf, workers=2):
-    return hf.shape[0] * ifft(hf, workers=workers)
+def freq2time(hf, workers=None):
+    ht = ifft(hf, workers=workers)
+    ht *= hf.shape[0]
+    return ht
 
 
-def harm2phase(ph, workers=2):
-    return (ph.shape[0] - 1) * 2 * irfft(ph, workers=workers)
+def harm2phase(ph, workers=None):
+    pp = irfft(ph, workers=workers)
+    pp *= (ph.shape[0] - 1) * 2
+    return pp
 
 
-def phase2harm(pp, workers=2):
+def phase2harm(pp, workers=None):
     ph = rfft(pp, workers=workers)
     # profile_harm_renorm
-    return ph / ph.shape[0]  # original version from Cyclic-modelling
+    ph /= ph.shape[0]  # original version from Cyclic-modelling
+    return ph
     # return ph/(2*(ph.shape[0]-1))
 
 
 def match_two_filters(hf1, hf2):
-    z = (hf1 * np.conj(hf2)).sum()
-    z2 = (hf2 * np.conj(hf2)).sum()  # = np.abs(hf2)**2.sum()
+    z = np.vdot(hf2, hf1)  # = (hf1 * np.conj(hf2)).sum(), vdot conjugates its first argument
+    z2 = np.vdot(hf2, hf2).real  # = (np.abs(hf2)**2).sum()
     z /= np.abs(z)
-    z *= np.sqrt(1.0 * hf1.shape[0] / np.real(z2))
+    z *= np.sqrt(1.0 * hf1.shape[0] / z2)
     return hf2 * z
 
 
@@ -1111,74 +1430,152 @@ def normalize_pp(pp):
     return harm2phase(ph)
 
 
-def normalize_cs(cs, bw, ref_freq):
+def normalize_cs(cs, bw, ref_freq, out=None):
+    """
+    Normalize a cyclic spectrum, or each of a stack of them (..., nchan, nharm)
+
+    Pass out=cs to normalize in place.
+    """
     rms1 = rms_cs(cs, ih=1, bw=bw, ref_freq=ref_freq)
-    rmsn = rms_cs(cs, ih=cs.shape[1] - 1, bw=bw, ref_freq=ref_freq)
+    rmsn = rms_cs(cs, ih=cs.shape[-1] - 1, bw=bw, ref_freq=ref_freq)
     normfac = np.sqrt(np.abs(rms1**2 - rmsn**2))
-    return cs / normfac
+    return np.divide(cs, np.asarray(normfac)[..., np.newaxis, np.newaxis], out=out)
 
 
 def rms_cs(cs, ih, bw, ref_freq):
-    nchan = cs.shape[0]
+    nchan = cs.shape[-2]
     imin, imax = chan_limits_cs(ih, nchan, bw, ref_freq)
-    rms = np.sqrt((np.abs(cs[imin:imax, ih]) ** 2).mean())
+    sl = cs[..., imin:imax, ih]
+    if sl.ndim > 1:
+        # a stack of cyclic spectra: one rms for each, accumulated exactly as for a single spectrum
+        # (explicit row count, so a harmonic with no unpadded channels gives nan like the single spectrum path)
+        rows = sl.reshape(int(np.prod(sl.shape[:-1])), sl.shape[-1])
+        power = np.array([np.vdot(row, row).real for row in rows]).reshape(sl.shape[:-1])
+        return np.sqrt(power / sl.shape[-1])
+    rms = np.sqrt(np.vdot(sl, sl).real / sl.size)  # sum of |cs|**2 without the abs/square temporaries
     return rms
 
 
 def cyclic_padding(cs, bw, ref_freq):
-    nharm = cs.shape[1]
-    nchan = cs.shape[0]
-    for ih in range(nharm):
-        imin, imax = chan_limits_cs(ih, nchan, bw, ref_freq)
-        cs[:imin, ih] = 0
-        cs[imax:, ih] = 0
+    """
+    Zero the channels of each harmonic that lie outside chan_limits_cs (in place)
+    """
+    nchan, nharm = cs.shape[-2:]  # the mask broadcasts over a stack of cyclic spectra
+    np.copyto(cs, 0, where=_padding_mask(nchan, nharm, bw, ref_freq))
     return cs
 
 
+@functools.lru_cache(maxsize=256)
 def chan_limits_cs(iharm, nchan, bw, ref_freq):
+    """
+    (min, max) channel range of harmonic iharm that is not padded; cached, since it only depends on the arguments
+    """
     inv_aspect = ref_freq * nchan
     inv_aspect *= iharm / (bw * 1e6)
     inv_aspect -= 1
     inv_aspect /= 2.0
     ichan = int(inv_aspect) + 1
     if ichan > nchan / 2:
-        ichan = int(nchan / 2)
+        ichan = nchan // 2
     return (ichan, nchan - ichan)  # min,max
 
 
-def cyclic_shear_cs(cs, shear, bw, ref_freq):
-    nharm = cs.shape[1]
-    nlag = cs.shape[0]
+@functools.lru_cache(maxsize=16)
+def _chan_limits_table(nharm, nchan, bw, ref_freq):
+    """
+    chan_limits_cs for every harmonic 0..nharm-1 at once, as read-only (imin, imax) arrays
+
+    These only depend on the arguments, so they are computed once and cached
+    """
+    inv_aspect = ref_freq * nchan
+    inv_aspect *= np.arange(nharm) / (bw * 1e6)
+    inv_aspect -= 1
+    inv_aspect /= 2.0
+    ichan = inv_aspect.astype(int) + 1  # astype truncates toward zero, like int()
+    ichan[ichan > nchan / 2] = nchan // 2
+    imin = ichan
+    imax = nchan - ichan
+    imin.setflags(write=False)
+    imax.setflags(write=False)
+    return imin, imax
+
+
+@functools.lru_cache(maxsize=16)
+def _padding_mask(nchan, nharm, bw, ref_freq):
+    """
+    Read-only (nchan, nharm) boolean mask which is True where cyclic_padding zeroes the cyclic spectrum
+    """
+    imin, imax = _chan_limits_table(nharm, nchan, bw, ref_freq)
+    chans = np.arange(nchan)[:, np.newaxis]
+    mask = (chans < imin[np.newaxis, :]) | (chans >= imax[np.newaxis, :])
+    mask.setflags(write=False)
+    return mask
+
+
+@functools.lru_cache(maxsize=16)
+def _shear_table(nlag, nharm, shear, bw, ref_freq):
+    """
+    Read-only (nlag, nharm) phases 2*pi*shear*tau*alpha of cyclic_shear_cs and the matching phasors exp(1j*phases)
+
+    The objective function shears by +-0.5 on every evaluation, so these are computed once and cached
+    """
     dtau = 1 / (bw * 1e6)
     dalpha = ref_freq
-    # cs2cc
-    cc = cs2cc(cs)
     lags = np.arange(nlag)
-    lags[int(nlag / 2) + 1 :] = lags[int(nlag / 2) + 1 :] - nlag
+    lags[nlag // 2 + 1 :] = lags[nlag // 2 + 1 :] - nlag
     tau1 = dtau * lags
     alpha1 = dalpha * np.arange(nharm)
 
     phases = np.outer(shear * (-2.0 * np.pi) * tau1, alpha1)
+    phasors = np.exp(1j * phases)
+    phases.setflags(write=False)
+    phasors.setflags(write=False)
+    return phases, phasors
 
-    cc = cc * np.exp(1j * phases)
+
+def cyclic_shear_cs(cs, shear, bw, ref_freq):
+    nharm = cs.shape[1]
+    nlag = cs.shape[0]
+    # cs2cc
+    cc = cs2cc(cs)
+    phases, phasors = _shear_table(nlag, nharm, shear, bw, ref_freq)
+
+    cc *= phasors
 
     return cc2cs(cc), phases
 
 
+def cyclic_shear_pair(cs, bw, ref_freq, nharm=None):
+    """
+    cyclic_shear_cs(cs, shear=0.5) and cyclic_shear_cs(cs, shear=-0.5) sharing a single cs2cc and cc2cs
+
+    cs may be a single (nchan, 1) column that is the same for every harmonic, e.g. hf[:, np.newaxis];
+    it is then transformed once and broadcast against the nharm harmonics of the phase ramp.
+    Returns (csplus, csminus, minus_phases)
+    """
+    nlag = cs.shape[0]
+    if nharm is None:
+        nharm = cs.shape[1]
+    cc = cs2cc(cs)
+    plus_phasors = _shear_table(nlag, nharm, 0.5, bw, ref_freq)[1]
+    minus_phases, minus_phasors = _shear_table(nlag, nharm, -0.5, bw, ref_freq)
+
+    # both sheared copies are transformed back together in one batched FFT
+    stacked = np.empty((2, nlag, nharm), dtype=np.result_type(cc, plus_phasors))
+    np.multiply(cc, plus_phasors, out=stacked[0])
+    np.multiply(cc, minus_phasors, out=stacked[1])
+    csplus, csminus = cc2cs(stacked, axis=1)
+    return csplus, csminus, minus_phases
+
+
 def make_model_cs(hf, s0, bw, ref_freq):
-    nchan = hf.shape[0]
     nharm = s0.shape[0]
-    # profile2cs
-    cs = np.repeat(s0[np.newaxis, :], nchan, axis=0)  # fill the cs model with the harmonic profile for each freq chan
-    # filter2cs
-    cs_tmp = np.repeat(hf[:, np.newaxis], nharm, axis=1)  # fill the cs_tmp model with the filter for each harmonic
+    # filter2cs: the filter is the same for each harmonic, so it is sheared as a single broadcast column
+    csplus, csminus, minus_phases = cyclic_shear_pair(hf[:, np.newaxis], bw=bw, ref_freq=ref_freq, nharm=nharm)
 
-    csplus, plus_phases = cyclic_shear_cs(cs_tmp, shear=0.5, bw=bw, ref_freq=ref_freq)
-    csminus, minus_phases = cyclic_shear_cs(
-        cs_tmp, shear=-0.5, bw=bw, ref_freq=ref_freq
-    )  # this is redundant, minus phases is just negative of plus phases
-
-    cs = cs * csplus * np.conj(csminus)
+    # profile2cs: the harmonic profile is the same for each freq chan, so it is broadcast along the channels
+    cs = csplus * s0[np.newaxis, :]
+    cs *= np.conj(csminus)
 
     cs = cyclic_padding(cs, bw, ref_freq)
 
@@ -1186,18 +1583,17 @@ def make_model_cs(hf, s0, bw, ref_freq):
 
 
 def optimize_profile(cs, hf, bw, ref_freq):
-    nchan = cs.shape[0]
     nharm = cs.shape[1]
-    # filter2cs
-    cs1 = np.repeat(hf[:, np.newaxis], nharm, axis=1)  # fill the cs_tmp model with the filter for each harmonic
-    csplus, plus_phases = cyclic_shear_cs(cs1, shear=0.5, bw=bw, ref_freq=ref_freq)
-
-    csminus, minus_phases = cyclic_shear_cs(cs1, shear=-0.5, bw=bw, ref_freq=ref_freq)
+    # filter2cs: both shears of the filter from one broadcast column (see make_model_cs)
+    csplus, csminus, minus_phases = cyclic_shear_pair(hf[:, np.newaxis], bw=bw, ref_freq=ref_freq, nharm=nharm)
 
     # cs H(-)H(+)*
-    cshmhp = cs * csminus * np.conj(csplus)
-    # |H(-)|^2 |H(+)|^2
-    maghmhp = (np.abs(csminus) * np.abs(csplus)) ** 2
+    cshmhp = cs * csminus
+    cshmhp *= np.conj(csplus)
+    # |H(-)|^2 |H(+)|^2 = |H(-)H(+)|^2, as re**2 + im**2 of the product (no abs and its square root)
+    hmhp = csminus * csplus
+    maghmhp = hmhp.real**2
+    maghmhp += hmhp.imag**2
     # fscrunch
     denom = fscrunch_cs(maghmhp, bw=bw, ref_freq=ref_freq)
     numer = fscrunch_cs(cshmhp, bw=bw, ref_freq=ref_freq)
@@ -1207,54 +1603,79 @@ def optimize_profile(cs, hf, bw, ref_freq):
 
 
 def fscrunch_cs(cs, bw, ref_freq):
-    cstmp = cs[:]
-    cstmp = cyclic_padding(cstmp, bw, ref_freq)
-    #    rm = np.abs(cs-cstmp).sum()
-    #    print "fscrunch saved:",rm
-    return cstmp.sum(0)
+    """
+    Sum over frequency channels of each harmonic, excluding the padded channels
+
+    cs is padded in place (see cyclic_padding), so pass a scratch array
+    """
+    return cyclic_padding(cs, bw, ref_freq).sum(0)
 
 
 def get_params(ht, rindex):
-    nlag = ht.shape[0]
-    params = np.zeros((2 * nlag - 1,), dtype="float")
-    if rindex > 0:
-        params[: 2 * (rindex)] = ht[:rindex].view("float")
-    params[2 * rindex] = ht[rindex].real
-    if rindex < nlag - 1:
-        params[2 * rindex + 1 :] = ht[rindex + 1 :].view("float")
-    return params
+    """
+    Pack the filter ht into the real parameter vector of the solver: the interleaved real and imaginary
+    parts of every lag, except the imaginary part of the reference lag rindex, which is fixed at zero
+    """
+    flat = np.ascontiguousarray(ht, dtype="complex").view("float")  # re, im pairs
+    iskip = 2 * rindex + 1
+    return np.concatenate((flat[:iskip], flat[iskip + 1 :]))
 
 
 def get_ht(params, rindex):
-    nlag = int((params.shape[0] + 1) / 2)
-    ht = np.zeros((nlag,), dtype="complex")
-    ht[:rindex] = params[: 2 * rindex].view("complex")
-    ht[rindex] = params[2 * rindex]
-    ht[rindex + 1 :] = params[2 * rindex + 1 :].view("complex")
-    return ht
+    """
+    Inverse of get_params
+    """
+    iskip = 2 * rindex + 1
+    flat = np.empty((params.shape[0] + 1,), dtype="float")
+    flat[:iskip] = params[:iskip]
+    flat[iskip] = 0.0
+    flat[iskip + 1 :] = params[iskip:]
+    return flat.view("complex")
+
+
+def _scratch(CS, name, shape, dtype):
+    """
+    Work array CS._<name> of the given shape and dtype, allocated on first use and reused by later calls
+    """
+    attr = "_" + name
+    buf = getattr(CS, attr, None)
+    if buf is None or buf.shape != shape or buf.dtype != dtype:
+        buf = np.empty(shape, dtype=dtype)
+        setattr(CS, attr, buf)
+    return buf
 
 
 def cyclic_merit_lag(x, *args):
     """
     The objective function. Computes mean squared merit and gradient
 
-    Format is compatible with scipy.optimize
+    Format is compatible with scipy.optimize: returns (merit, grad) where grad is the analytic
+    gradient with respect to the packed parameters x (see get_params), so the L-BFGS-B solver
+    never needs to fall back on finite differences (approx_grad must stay off)
     """
     CS = args[0]
-    print("rindex", CS.rindex)
     ht = get_ht(x, CS.rindex)
     hf = time2freq(ht)
     CS.hf = hf
     CS.ht = ht
     cs_model, csplus, csminus, phases = make_model_cs(hf, CS.s0, CS.bw, CS.ref_freq)
-    merit = 2 * (np.abs(cs_model[:, 1:] - CS.cs[:, 1:]) ** 2).sum()  # ignore zeroth harmonic (dc term)
+    # model - data, shared by the merit and the gradient
+    diff = np.subtract(cs_model, CS.cs, out=_scratch(CS, "diff", cs_model.shape, np.result_type(cs_model, CS.cs)))
+    # ignore zeroth harmonic (dc term); zeroing it lets the merit run over the whole contiguous array, and
+    # leaves the gradient unchanged since cs2cc works per harmonic and only harmonics 1.. are summed
+    diff[:, 0] = 0
+    merit = 2 * np.vdot(diff, diff).real
 
     # the objval list keeps track of how the convergence is going
     CS.objval.append(merit)
 
     # gradient_lag
-    diff = cs_model - CS.cs  # model - data
-    cc1 = cs2cc(diff * csminus)
+    # both lag-domain terms are transformed together in one batched FFT
+    stacked = _scratch(CS, "stacked", (2,) + diff.shape, np.result_type(diff, csminus))
+    np.multiply(diff, csminus, out=stacked[0])
+    np.conjugate(diff, out=stacked[1])  # conjugate(res)
+    stacked[1] *= csplus  # multiply by positive shear
+    cc1, cc2 = cs2cc(stacked, axis=1, overwrite_x=True)  # the transform may reuse the scratch buffer
 
     # original c code for reference:
     #    for (ilag=0; ilag<cc1.nlag; ilag++) {
@@ -1273,19 +1694,15 @@ def cyclic_merit_lag(x, *args):
 
     # we reuse phases and csminus, csplus from the make_model_cs call
 
-    phasors = np.exp(1j * phases)
-    cs0 = np.repeat(CS.s0[np.newaxis, :], CS.nlag, axis=0)  # filter2cs
-    grad = 4.0 * cc1 * phasors * np.conj(cs0) / CS.nchan
-    grad = grad[:, 1:].sum(1)  # sum over all harmonics to get function of lag
-
-    # conjugate(res)
-    # calc positive shear
-    # multiply
-    # cs2cc
-    cc2 = cs2cc(np.conj(diff) * csplus)
-    grad2 = 4.0 * cc2 * np.conj(phasors) * cs0 / CS.nchan
-
-    grad = grad + grad2[:, 1:].sum(1)
+    # each term is multiplied by its phasor and the profile and summed over harmonics 1.. in a single
+    # einsum pass, and the constant 4/nchan is applied once to the summed vector
+    nlag, nharm = cs_model.shape
+    phasors = _shear_table(nlag, nharm, -0.5, CS.bw, CS.ref_freq)[1]  # exp(1j * phases), cached
+    conj_phasors = _shear_table(nlag, nharm, 0.5, CS.bw, CS.ref_freq)[1]  # exp(-1j * phases), cached
+    s0 = CS.s0[1:]
+    grad = np.einsum("ij,ij,j->i", cc1[:, 1:], phasors[:, 1:], np.conj(s0))  # sum over all harmonics
+    grad += np.einsum("ij,ij,j->i", cc2[:, 1:], conj_phasors[:, 1:], s0)
+    grad *= 4.0 / CS.nchan
     CS.grad = grad[:]
     CS.model = cs_model[:]
 
@@ -1307,8 +1724,10 @@ def loadCyclicSolver(statefile):
     Load previously saved Cyclic Solver class
     """
     with open(statefile, "rb") as fh:
-        cys = pickle.load(fh)
-    return cys
+        if fh.read(2) != b"PK":  # saveState writes a zip (npz) archive, older versions wrote a pickle
+            fh.seek(0)
+            return pickle.load(fh)
+    return CyclicSolver(statefile=statefile)
 
 
 if __name__ == "__main__":